@@ -6,7 +6,7 @@ A tool to generate skeleton puredata or max external files.
 Requires the following python packages:
 
 - mako
-- pyyaml
+- pyyaml (built with libyaml for the faster C loader)
 
 >>> import xtgen
 
@@ -21,29 +21,159 @@ Requires the following python packages:
 
 
 """
-import argparse
+import hashlib
 import os
+import pickle
 import sys
+import threading
+from functools import cached_property, lru_cache
 from pathlib import Path
-from types import SimpleNamespace
 
-import yaml
-from mako.template import Template
-from mako.lookup import TemplateLookup
+# yaml, mako, shutil, argparse and concurrent.futures are imported where they
+# are used, so that loading a cached spec or printing --help stays cheap.
 
 
 # ----------------------------------------------------------------------------
 # CONSTANTS
 
 TEMPLATE_DIR = os.path.join(os.getcwd(), "templates")
-TEMPLATE_LOOKUP = TemplateLookup(directories=[TEMPLATE_DIR])
+PD_MAKEFILE = os.path.join("resources", "pd", "Makefile.pdlibbuilder")
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "xtgen")
+SPEC_CACHE_DIR = os.path.join(CACHE_DIR, "specs")
+# one directory per template directory: mako names compiled modules after
+# the template's path relative to it, so checkouts must not share one
+TEMPLATE_CACHE_DIR = os.path.join(
+    CACHE_DIR,
+    "templates",
+    hashlib.blake2b(TEMPLATE_DIR.encode(), digest_size=16).hexdigest(),
+)
+CACHE_KEY_FILE = ".key"  # content hash of a project cache entry
 
 # ----------------------------------------------------------------------------
 # UTILITY FUNCTIONS
 
-c_type = lambda s: f"t_{s}"
-lookup_address = lambda s: f"&s_{s}"
-lookup_routine = lambda s: f'gensym("{s}")'
+
+def template_lookup(module_directory=TEMPLATE_CACHE_DIR):
+    """returns a lookup which persists compiled templates in module_directory
+
+    Mako recompiles a cached module whenever its template is newer, so the
+    in-process filesystem checks can be skipped.
+    """
+    from mako.lookup import TemplateLookup
+
+    return TemplateLookup(
+        directories=[TEMPLATE_DIR],
+        module_directory=module_directory,
+        filesystem_checks=False,
+        collection_size=64,
+        input_encoding="utf-8",
+    )
+
+
+TEMPLATE_LOOKUP = None  # built on first use by get_template()
+TEMPLATE_MODULE_DIR = TEMPLATE_CACHE_DIR
+_TEMPLATE_LOOKUP_LOCK = threading.Lock()
+
+
+def configure_templates(module_directory):
+    """sets where compiled templates are kept (None disables the disk cache)"""
+    global TEMPLATE_LOOKUP, TEMPLATE_MODULE_DIR
+    TEMPLATE_LOOKUP = None
+    TEMPLATE_MODULE_DIR = module_directory
+
+
+def get_template(name):
+    global TEMPLATE_LOOKUP
+    lookup = TEMPLATE_LOOKUP
+    if lookup is None:
+        # renders run on threads: only the first one may build the lookup
+        with _TEMPLATE_LOOKUP_LOCK:
+            if TEMPLATE_LOOKUP is None:
+                TEMPLATE_LOOKUP = template_lookup(TEMPLATE_MODULE_DIR)
+            lookup = TEMPLATE_LOOKUP
+    return lookup.get_template(name)
+
+
+def _copy_if_changed(src, dst):
+    """copies src to dst unless dst already matches it in size and mtime"""
+    import shutil
+
+    s = os.stat(src)
+    try:
+        d = os.stat(dst)
+        if d.st_size == s.st_size and d.st_mtime_ns == s.st_mtime_ns:
+            return
+    except FileNotFoundError:
+        pass
+    shutil.copy2(src, dst)  # keeps the mtime the next check compares
+
+
+def _is_gimme(params):
+    """message method params that pd passes as A_GIMME"""
+    return len(params) > 6 or (len(params) == 1 and params[0] == "list")
+
+
+@lru_cache(maxsize=1)
+def _spec_cache_version():
+    """hash of this module: any change to validate_spec invalidates entries"""
+    return hashlib.blake2b(Path(__file__).read_bytes(), digest_size=16).digest()
+
+
+def _spec_cache_path(path):
+    key = hashlib.blake2b(path.encode(), digest_size=16).hexdigest()
+    return os.path.join(SPEC_CACHE_DIR, key + ".pickle")
+
+
+@lru_cache(maxsize=None)
+def _load_yaml(path, stamp, use_cache):
+    cache = _spec_cache_path(path)
+    if use_cache and os.path.exists(cache):
+        try:
+            with open(cache, "rb") as f:
+                version, cached_stamp, spec = pickle.load(f)
+            if version == _spec_cache_version() and cached_stamp == stamp:
+                return spec  # entries are only written once validated
+        except Exception:
+            pass  # unreadable or malformed entry: reparse and overwrite it
+
+    import yaml
+
+    try:
+        from yaml import CSafeLoader as SafeLoader
+    except ImportError:
+        from yaml import SafeLoader
+
+    with open(path, "rb") as f:
+        spec = yaml.load(f, Loader=SafeLoader)
+    validate_spec(spec)
+
+    if use_cache:
+        tmp = f"{cache}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(SPEC_CACHE_DIR, exist_ok=True)
+            with open(tmp, "wb") as f:
+                entry = (_spec_cache_version(), stamp, spec)
+                pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache)
+        except OSError:  # unwritable cache: the spec itself is still good
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+    return spec
+
+
+def load_spec(path, use_cache=True):
+    """returns the parsed and validated yaml spec at path
+
+    The file is only reparsed (and revalidated) when its mtime or size
+    changes: within a process via lru_cache and, with use_cache, across runs
+    via a pickle of the validated spec kept in SPEC_CACHE_DIR.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    # size catches edits within the filesystem's mtime granularity
+    return _load_yaml(path, (st.st_mtime_ns, st.st_size), use_cache)
 
 
 # ----------------------------------------------------------------------------
@@ -51,11 +181,27 @@ lookup_routine = lambda s: f'gensym("{s}")'
 
 
 class Type:
-    VALID_TYPES = []
+    __slots__ = (
+        "name",
+        "c_type",
+        "lookup_address",
+        "lookup_routine",
+        "type_method_arg",
+    )
+
+    VALID_TYPES = frozenset()
+    NO_C_TYPE = frozenset()
+    TYPE_METHOD_ARGS = {}
 
     def __init__(self, name):
-        assert name in self.VALID_TYPES
-        self.name = name
+        assert type(name) is str and name in self.VALID_TYPES
+        self.name = sys.intern(name)
+        if name not in self.NO_C_TYPE:
+            self.c_type = sys.intern(f"t_{name}")
+        self.lookup_address = sys.intern(f"&s_{name}")
+        self.lookup_routine = sys.intern(f'gensym("{name}")')
+        if name in self.TYPE_METHOD_ARGS:  # 'signal' has no type method
+            self.type_method_arg = self.TYPE_METHOD_ARGS[name]
 
     def __str__(self):
         return self.name
@@ -65,146 +211,118 @@ class Type:
 
 
 class ScalarType(Type):
-    VALID_TYPES = ["bang", "float", "symbol", "pointer", "signal"]
-
-    @property
-    def c_type(self):
-        return f"t_{self.name}"
+    __slots__ = ()
 
-    @property
-    def lookup_address(self):
-        return f"&s_{self.name}"
-
-    @property
-    def lookup_routine(self):
-        return f'gensym("{self.name}")'
+    VALID_TYPES = frozenset(["bang", "float", "symbol", "pointer", "signal"])
 
-    @property
-    def type_method_arg(self):
-        return {
-            "bang": "",
-            "float": "t_floatarg f",
-            "int": "t_floatarg f",
-            "symbol": "t_symbol *s",
-            "pointer": "t_gpointer *pt",
-        }[self.name]
+    TYPE_METHOD_ARGS = {
+        "bang": "",
+        "float": "t_floatarg f",
+        "int": "t_floatarg f",
+        "symbol": "t_symbol *s",
+        "pointer": "t_gpointer *pt",
+    }
 
 
 class CompoundType(Type):
-    VALID_TYPES = ["list", "anything"]
-
-    @property
-    def c_type(self):
-        assert self.name != "anything"  # doesn't exist for 'anything'
-        return f"t_{self.name}"
-
-    @property
-    def lookup_address(self):
-        return f"&s_{self.name}"
+    __slots__ = ()
 
-    @property
-    def lookup_routine(self):
-        return f'gensym("{self.name}")'
+    VALID_TYPES = frozenset(["list", "anything"])
+    NO_C_TYPE = frozenset(["anything"])  # doesn't exist for 'anything'
 
-    @property
-    def type_method_arg(self):
-        return {
-            "list": "t_symbol *s, int argc, t_atom *argv",
-            "anything": "t_symbol *s, int argc, t_atom *argv",
-        }[self.name]
+    TYPE_METHOD_ARGS = {
+        "list": "t_symbol *s, int argc, t_atom *argv",
+        "anything": "t_symbol *s, int argc, t_atom *argv",
+    }
 
 
 class Object:
-    def __init__(self, parent, **kwargs):
+    __slots__ = ("parent",)
+
+    def __init__(self, parent):
         self.parent = parent
-        self.ns = SimpleNamespace(**kwargs)
 
     def __repr__(self):
         return f"<{self.__class__.__name__}: '{self.name}'>"
 
 
 class TypeMethod(Object):
-    valid_types = ["bang", "float", "int", "symbol", "pointer", "list", "anything"]
+    __slots__ = ("type", "doc", "args", "class_addmethod")
+
+    valid_types = frozenset(
+        ["bang", "float", "int", "symbol", "pointer", "list", "anything"]
+    )
+
+    # method arguments following the `t_<name> *x` self argument
+    arg_suffixes = {
+        "bang": "",
+        "float": ", t_floatarg f",
+        "int": ", t_floatarg f",
+        "symbol": ", t_symbol *s",
+        "pointer": ", t_gpointer *pt",
+        "list": ", t_symbol *s, int argc, t_atom *argv",
+        "anything": ", t_symbol *s, int argc, t_atom *argv",
+    }
 
     def __init__(self, parent, **kwargs):
-        super().__init__(parent, **kwargs)
-        self.type = self.ns.type
-        self.doc = self.ns.doc if hasattr(self.ns, "doc") else ""
+        super().__init__(parent)
+        self.type = kwargs["type"]
+        self.doc = kwargs.get("doc", "")
         assert self.type in self.valid_types
+        self.args = self._args()
+        self.class_addmethod = self._class_addmethod()
 
     @property
     def name(self):
         return self.type
 
-    @property
-    def args(self):
-        if self.type == "bang":
-            return f"{self.parent.type} *x"
-
-        elif self.type in ["float", "int"]:
-            return f"{self.parent.type} *x, t_floatarg f"
-
-        elif self.type == "symbol":
-            return f"{self.parent.type} *x, t_symbol *s"
-
-        elif self.type == "pointer":
-            return f"{self.parent.type} *x, t_gpointer *pt"
-
-        elif self.type in ["list", "anything"]:
-            return f"{self.parent.type} *x, t_symbol *s, int argc, t_atom *argv"
-
-        else:
-            raise Exception(f"argument '{self.type}' not implemented")
+    def _args(self):
+        return self.parent.x_prefix + self.arg_suffixes[self.type]
 
-    @property
-    def class_addmethod(self):
-        return (
-            f"class_add{self.type}({self.parent.klass}, {self.parent.name}_{self.type})"
-        )
+    def _class_addmethod(self):
+        p = self.parent
+        return f"class_add{self.type}({p.klass}, {p.method_prefix}{self.type})"
 
 
 class MessagedMethod(Object):
-    def __init__(self, parent, **kwargs):
-        super().__init__(parent, **kwargs)
-        self.name = self.ns.name
-        self.doc = self.ns.doc if hasattr(self.ns, "doc") else ""
-        self.params = self.ns.params
+    __slots__ = ("name", "doc", "params", "args", "class_addmethod")
 
-    @property
-    def args(self):
-        prefix = f"{self.parent.type} *x"
-
-        if len(self.params) == 0:
+    def __init__(self, parent, **kwargs):
+        super().__init__(parent)
+        self.name = kwargs["name"]
+        self.doc = kwargs.get("doc", "")
+        self.params = kwargs["params"]
+        gimme = _is_gimme(self.params)
+        self.args = self._args(gimme)
+        self.class_addmethod = self._class_addmethod(gimme)
+
+    def _args(self, gimme):
+        p = self.parent
+        prefix = p.x_prefix
+
+        if not self.params:
             return prefix
+        elif gimme:
+            return f"{prefix}, t_symbol *s, int argc, t_atom *argv"
         else:
-            if (self.params == ["list"]) or (len(self.params) > 6):
-                return f"{prefix}, t_symbol *s, int argc, t_atom *argv"
-            else:
-                types = []
-                for i, t in enumerate(self.params):
-                    types.append(self.parent.func_type_args[t] + str(i))
-                type_str = ", ".join(types)
-                return f"{prefix}, {type_str}"
+            func_type_args = p.func_type_args
+            type_str = ", ".join(
+                f"{func_type_args[t]}{i}" for i, t in enumerate(self.params)
+            )
+            return f"{prefix}, {type_str}"
 
-    @property
-    def class_addmethod(self):
-        prefix = (
-            f"class_addmethod({self.parent.name}_class, "
-            f"(t_method){self.parent.name}_{self.name}, "
-            f'gensym("{self.name}")'
-        )
+    def _class_addmethod(self, gimme):
+        p, name = self.parent, self.name
+        prefix = f'{p.addmethod_prefix}{name}, gensym("{name}")'
 
-        if len(self.params) == 0:
+        if not self.params:
             return f"{prefix}, 0)"
+        elif gimme:
+            return f"{prefix}, A_GIMME, 0)"
         else:
-            if (self.params == ["list"]) or (len(self.params) > 6):
-                return f"{prefix}, A_GIMME, 0)"
-            else:
-                types = []
-                for t in self.params:
-                    types.append(self.parent.mapping[t])
-                type_str = ", ".join(types)
-                return f"{prefix}, {type_str}, 0)"
+            mapping = p.mapping
+            type_str = ", ".join(mapping[t] for t in self.params)
+            return f"{prefix}, {type_str}, 0)"
 
 
 # class Inlet(Object):
@@ -228,6 +346,16 @@ class MessagedMethod(Object):
 
 
 class Param(Object):
+    __slots__ = (
+        "name",
+        "initial",
+        "type",
+        "is_arg",
+        "has_inlet",
+        "pd_type",
+        "struct_declaration",
+    )
+
     c_types = {
         "atom": "t_atom",
         "float": "t_float",
@@ -238,33 +366,50 @@ class Param(Object):
     }
 
     def __init__(self, parent, **kwargs):
-        super().__init__(parent, **kwargs)
-        self.name = self.ns.name
-        self.initial = self.ns.initial
-        self.type = self.ns.type
-        self.is_arg = self.ns.arg
-        self.has_inlet = self.ns.inlet
+        super().__init__(parent)
+        self.name = kwargs["name"]
+        self.initial = kwargs["initial"]
+        self.type = kwargs["type"]
+        self.is_arg = kwargs["arg"]
+        self.has_inlet = kwargs["inlet"]
+        self.pd_type = self.c_types[self.type]
+        self.struct_declaration = f"{self.pd_type} {self.name}"
 
     # def as_inlet(self):
     #     return Inlet(self.parent, vars(self.ns))
 
-    @property
-    def pd_type(self):
-        return self.c_types[self.type]
-
-    @property
-    def struct_declaration(self):
-        return f"{self.pd_type} {self.name}"
-
 
 class Outlet(Object):
+    __slots__ = ("name", "type")
+
     def __init__(self, parent, **kwargs):
-        super().__init__(parent, **kwargs)
-        self.name = self.ns.name
-        self.type = self.ns.type
+        super().__init__(parent)
+        self.name = kwargs["name"]
+        self.type = kwargs["type"]
 
 
 class External:
+    __slots__ = (
+        "name",
+        "type",
+        "klass",
+        "x_prefix",
+        "method_prefix",
+        "addmethod_prefix",
+        "meta",
+        "help",
+        "alias",
+        "params",
+        "args",
+        "inlets",
+        "outlets",
+        "type_methods",
+        "message_methods",
+        "class_new_args",
+        "class_type_signature",
+        "class_addcreator",
+    )
+
     mapping = {
         "float": "A_DEFFLOAT",
         "symbol": "A_DEFSYMBOL",
@@ -277,77 +422,173 @@ class External:
         "anything": "t_symbol *s, int argc, t_atom *argv",
     }
 
-    def __init__(self, **kwargs):
-        self.ns = SimpleNamespace(**kwargs)
-        self.name = self.ns.name
-        self.type = f"t_{self.name}"
-        self.klass = f"{self.name}_class"
-        self.meta = self.ns.meta
-        self.help = self.ns.help
-        self.alias = self.ns.alias if hasattr(self.ns, "alias") else None
+    addcreator_fmt = 'class_addcreator((t_newmethod){}_new, gensym("{}"), {})'
+
+    def __init__(self, params, outlets, type_methods, message_methods, **kwargs):
+        self.name = kwargs["name"]
+        self.type = sys.intern(f"t_{self.name}")
+        self.klass = sys.intern(f"{self.name}_class")
+        # fragments shared by every method and class_add* call of this external
+        self.x_prefix = f"{self.type} *x"
+        self.method_prefix = f"{self.name}_"
+        self.addmethod_prefix = f"class_addmethod({self.klass}, (t_method){self.name}_"
+        self.meta = kwargs["meta"]
+        self.help = kwargs["help"]
+        self.alias = kwargs.get("alias")
+
+        # the spec's lists are consumed here: only the built objects are kept
+        self.params = tuple(Param(self, **p) for p in params)
+        self.args = tuple(p for p in self.params if p.is_arg)
+        self.inlets = tuple(p for p in self.params if p.has_inlet)
+        self.outlets = tuple(Outlet(self, **o) for o in outlets)
+        self.type_methods = tuple(TypeMethod(self, **m) for m in type_methods)
+        self.message_methods = tuple(
+            MessagedMethod(self, **m) for m in message_methods
+        )
+
+        self.class_new_args = self._class_new_args()
+        self.class_type_signature = self._class_type_signature()
+        self.class_addcreator = self._class_addcreator() if self.alias else None
 
     def __repr__(self):
         return f"<{self.__class__.__name__}: '{self.name}'>"
 
-    @property
-    def params(self):
-        return [Param(self, **p) for p in self.ns.params]
-
-    @property
-    def args(self):
-        return [p for p in self.params if p.is_arg]
-
-    @property
-    def inlets(self):
-        return [p for p in self.params if p.has_inlet]
-
-    @property
-    def outlets(self):
-        return [Outlet(self, **o) for o in self.ns.outlets]
-
-    @property
-    def type_methods(self):
-        return [TypeMethod(self, **m) for m in self.ns.type_methods]
-
-    @property
-    def message_methods(self):
-        return [MessagedMethod(self, **m) for m in self.ns.message_methods]
-
-    @property
-    def class_new_args(self):
+    def _class_new_args(self):
         if len(self.args) == 0:
             return "void"
         elif 0 < len(self.args) <= 6:
-            types = []
-            for i, t in enumerate(self.args):
-                types.append(self.func_type_args[t.type] + str(i))
-            type_str = ", ".join(types)
-            return type_str
+            func_type_args = self.func_type_args
+            return ", ".join(
+                f"{func_type_args[p.type]}{i}" for i, p in enumerate(self.args)
+            )
         elif self.params == "anything" or len(self.args) > 6:
             return "t_symbol *s, int argc, t_atom *argv"
         else:
             raise Exception("cannot populate class_new_args")
 
-    @property
-    def class_type_signature(self):
+    def _class_type_signature(self):
         suffix = ", 0"
         if len(self.args) == 0:
             return suffix
         elif 0 < len(self.args) <= 6:
-            types = [self.mapping[i.type] for i in self.args]
-            return ", ".join(types) + suffix
+            mapping = self.mapping
+            return ", ".join(mapping[p.type] for p in self.args) + suffix
         else:
             return "A_GIMME" + suffix
 
-    @property
-    def class_addcreator(self):
-        return (
-            f"class_addcreator((t_newmethod)"
-            f'{self.name}_new, gensym("{self.alias}"), '
-            f"{self.class_type_signature})"
+    def _class_addcreator(self):
+        return self.addcreator_fmt.format(
+            self.name, self.alias, self.class_type_signature
         )
 
 
+# ----------------------------------------------------------------------------
+# SPEC VALIDATION
+
+EXTERNAL_FIELDS = frozenset(
+    [
+        "name",
+        "meta",
+        "help",
+        "params",
+        "outlets",
+        "type_methods",
+        "message_methods",
+    ]
+)
+META_FIELDS = frozenset(["desc", "features", "author", "repo"])
+PARAM_FIELDS = frozenset(["name", "type", "initial", "arg", "inlet"])
+OUTLET_FIELDS = frozenset(["name", "type"])
+TYPE_METHOD_FIELDS = frozenset(["type"])
+MESSAGE_METHOD_FIELDS = frozenset(["name", "params"])
+LIST_FIELDS = ("params", "outlets", "type_methods", "message_methods")
+OUTLET_TYPES = ScalarType.VALID_TYPES | CompoundType.VALID_TYPES
+
+
+def _reject_entry(entry, fields, what):
+    if type(entry) is not dict:
+        raise ValueError(f"{what} must be a mapping")
+    missing = ", ".join(sorted(fields - entry.keys()))
+    raise ValueError(f"{what} is missing {missing}")
+
+
+def _reject_type(type_name, valid, what):
+    raise ValueError(
+        f"{what} has invalid type '{type_name}' (valid: {', '.join(sorted(valid))})"
+    )
+
+
+def validate_spec(spec):
+    """checks a parsed spec in one pass, raising ValueError on the first error
+
+    Covers the fields the classes above and the templates read (meta
+    included), so that a bad spec fails here rather than mid-render. Error
+    messages are only formatted once a check has failed.
+    """
+    externals = spec.get("externals") if type(spec) is dict else None
+    if type(externals) is not list or not externals:
+        raise ValueError("spec must contain a non-empty 'externals' list")
+
+    param_types = Param.c_types
+    arg_types = External.func_type_args
+    type_method_types = TypeMethod.valid_types
+    message_param_types = External.mapping
+
+    for ext in externals:
+        if type(ext) is not dict or not ext.keys() >= EXTERNAL_FIELDS:
+            _reject_entry(ext, EXTERNAL_FIELDS, "external")
+        name = ext["name"]
+        meta = ext["meta"]
+        if type(meta) is not dict or not meta.keys() >= META_FIELDS:
+            _reject_entry(meta, META_FIELDS, f"{name} meta")
+        if type(meta["desc"]) is not str:
+            raise ValueError(f"{name} meta desc must be a string")
+        if type(meta["features"]) is not list:
+            raise ValueError(f"{name} meta features must be a list")
+        for field in LIST_FIELDS:
+            if type(ext[field]) is not list:
+                raise ValueError(f"{name} {field} must be a list")
+
+        args = []
+        for p in ext["params"]:
+            if type(p) is not dict or not p.keys() >= PARAM_FIELDS:
+                _reject_entry(p, PARAM_FIELDS, f"{name} param")
+            if type(p["type"]) is not str or p["type"] not in param_types:
+                _reject_type(p["type"], param_types, f"{name} param '{p['name']}'")
+            if p["arg"]:
+                args.append(p)
+        if len(args) <= 6:
+            for p in args:
+                if p["type"] not in arg_types:
+                    _reject_type(p["type"], arg_types, f"{name} arg '{p['name']}'")
+
+        for o in ext["outlets"]:
+            if type(o) is not dict or not o.keys() >= OUTLET_FIELDS:
+                _reject_entry(o, OUTLET_FIELDS, f"{name} outlet")
+            if type(o["type"]) is not str or o["type"] not in OUTLET_TYPES:
+                _reject_type(o["type"], OUTLET_TYPES, f"{name} outlet '{o['name']}'")
+
+        for m in ext["type_methods"]:
+            if type(m) is not dict or not m.keys() >= TYPE_METHOD_FIELDS:
+                _reject_entry(m, TYPE_METHOD_FIELDS, f"{name} type method")
+            if type(m["type"]) is not str or m["type"] not in type_method_types:
+                _reject_type(m["type"], type_method_types, f"{name} type method")
+
+        for m in ext["message_methods"]:
+            if type(m) is not dict or not m.keys() >= MESSAGE_METHOD_FIELDS:
+                _reject_entry(m, MESSAGE_METHOD_FIELDS, f"{name} message method")
+            params = m["params"]
+            if type(params) is not list:
+                what = f"{name} message method '{m['name']}'"
+                raise ValueError(f"{what} params must be a list")
+            if _is_gimme(params):
+                continue  # passed as A_GIMME
+            for t in params:
+                if type(t) is not str or t not in message_param_types:
+                    what = f"{name} message method '{m['name']}'"
+                    _reject_type(t, message_param_types, what)
+
+
 # ----------------------------------------------------------------------------
 # MAIN CLASS
 
@@ -355,52 +596,272 @@ class External:
 class PdProject:
     """main class to manage external projects and related files."""
 
-    def __init__(self, spec_yml, target_dir="output"):
+    # (template, outfile) pairs rendered after the external's source file
+    templates = (
+        ("pd-Makefile.mako", "Makefile"),
+        ("README.md.mako", "README.md"),
+    )
+
+    # everything a project renders, by is_dsp (outfile None: <fullname>.c)
+    sources_by_dsp = {
+        False: (("pd-external.c.mako", None),) + templates,
+        True: (("pd-dsp-external.c.mako", None),) + templates,
+    }
+
+    def __init__(self, spec_yml, target_dir="output", use_cache=True):
         self.spec_yml = Path(spec_yml)
         self.fullname = Path(spec_yml).stem
         self.name = self.fullname.strip("~")
         self.is_dsp = self.fullname.endswith("~")
         self.target_dir = Path(target_dir)
         self.project_path = self.target_dir / self.fullname
+        self.use_cache = use_cache
+        self._spec = load_spec(self.spec_yml, use_cache)
+
+    @property
+    def spec(self):
+        return self._spec
+
+    @cached_property
+    def external(self):
+        """the model shared by every file rendered for this project"""
+        return External(**self.spec["externals"][0])
 
-    def cmd(self, shell, *args, **kwds):
-        os.system(shell.format(*args, **kwds))
+    @property
+    def sources(self):
+        return self.sources_by_dsp[self.is_dsp]
+
+    @property
+    def outputs(self):
+        """names of the files generated in project_path"""
+        names = [Path(PD_MAKEFILE).name]
+        names += [outfile or self.fullname + ".c" for _, outfile in self.sources]
+        return names
+
+    @property
+    def cache_path(self):
+        """this spec's one cache entry (replaced whenever its inputs change)"""
+        spec = f"pd:{self.spec_yml.resolve()}:{self.fullname}"
+        key = hashlib.blake2b(spec.encode(), digest_size=16).hexdigest()
+        return Path(CACHE_DIR) / "projects" / key
+
+    @property
+    def cache_key(self):
+        """hash of everything the generated files depend on"""
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"pd:{self.fullname}".encode())
+        h.update(Path(__file__).read_bytes())
+        h.update(self.spec_yml.read_bytes())
+        h.update(Path(PD_MAKEFILE).read_bytes())
+        for template, _ in self.sources:
+            h.update(Path(TEMPLATE_DIR, template).read_bytes())
+        return h.hexdigest()
 
     def generate(self):
-        try:
-            Path("output").mkdir(exist_ok=True)
-            self.project_path.mkdir(exist_ok=True)
-        except OSError:
+        if self.project_path.exists() and not self.project_path.is_dir():
             print(f"{self.project_path} already exists")
             return
+        self.project_path.mkdir(parents=True, exist_ok=True)
 
-        self.cmd(f"cp -rf resources/pd/Makefile.pdlibbuilder {self.project_path}")
-        if self.is_dsp:
-            self.render("pd-dsp-external.c.mako")
-        else:
-            self.render("pd-external.c.mako")
-        self.render("pd-Makefile.mako", "Makefile")
-        self.render("README.md.mako", "README.md")
-
-    def render(self, template, outfile=None):
-        with open(self.spec_yml) as f:
-            yml = yaml.safe_load(f.read())
-            ext_yml = yml["externals"][0]
-
-        templ = Template(filename=os.path.join(TEMPLATE_DIR, template))
-        external = External(**ext_yml)
-        rendered = templ.render(e=external)
+        cache = self.cache_path if self.use_cache else None
+        key = self.cache_key if cache else None
+        if cache and self.restore(cache, key):
+            print(self.project_path, "restored from cache")
+            return
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        _copy_if_changed(PD_MAKEFILE, self.project_path / Path(PD_MAKEFILE).name)
+        external = self.external
+        # renders only read the shared external and write separate files
+        with ThreadPoolExecutor(len(self.sources)) as pool:
+            jobs = [pool.submit(self.render, t, external, o) for t, o in self.sources]
+            lines = [f"{job.result()} rendered\n" for job in jobs]
+        sys.stdout.write("".join(lines))
+
+        if cache:
+            self.store(cache, key)
+
+    def restore(self, cache, key):
+        """copies the generated files out of a cache entry matching key"""
+        import shutil
+
+        try:
+            if (cache / CACHE_KEY_FILE).read_text() != key:
+                return False
+            # copyfile, not copy2: restored files must look freshly written
+            # to make, just like rendered ones
+            for name in self.outputs:
+                shutil.copyfile(cache / name, self.project_path / name)
+        except OSError:  # no entry, or an incomplete one: regenerate
+            return False
+        return True
+
+    def store(self, cache, key):
+        """replaces the cache entry with the generated files (and only those)
+
+        Best effort: the project is already generated, so a cache that
+        can't be written is skipped rather than failing the run.
+        """
+        import shutil
+
+        tmp = cache.with_name(f"{cache.name}.{os.getpid()}.tmp")
+        old = cache.with_name(f"{cache.name}.{os.getpid()}.old")
+        try:
+            tmp.mkdir(parents=True, exist_ok=True)
+            for name in self.outputs:
+                shutil.copy2(self.project_path / name, tmp / name)
+            (tmp / CACHE_KEY_FILE).write_text(key)
+            if cache.exists():
+                cache.rename(old)
+            tmp.rename(cache)
+        except OSError:  # unwritable cache, or another run stored it first
+            shutil.rmtree(tmp, ignore_errors=True)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def check(self):
+        """renders every template of the project in memory, writing nothing"""
+        import io
+
+        from mako.runtime import Context
+
+        external = self.external
+        for template, _ in self.sources:
+            get_template(template).render_context(Context(io.StringIO(), e=external))
+
+    def render(self, template, external, outfile=None):
+        from mako.runtime import Context
+
+        templ = get_template(template)
         if not outfile:
             outfile = self.fullname + ".c"
         target = self.project_path / outfile
-        with open(target, "w") as f:
-            f.write(rendered)
-        print(target, "rendered")
+        # render beside the target and swap it in: a failed render never
+        # leaves a truncated file behind (or clobbers a good one)
+        tmp = target.with_name(f".{outfile}.{os.getpid()}.tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8", buffering=65536) as f:
+                templ.render_context(Context(f, e=external))
+            os.replace(tmp, target)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return target
+
+
+def _generate(specs, target_dir, use_cache):
+    for spec_yml in specs:
+        PdProject(spec_yml, target_dir, use_cache).generate()
+
+
+def generate_many(specs, target_dir="output", use_cache=True):
+    """generates a project for each spec, in parallel worker processes
+
+    Workers share the compiled templates in the lookup's module_directory.
+    Specs that map to the same project directory (e.g. a/counter.yml and
+    b/counter.yml) are generated in order by a single job, so the last one
+    wins as it would sequentially. With a single worker everything is
+    generated in this process, sharing its template lookup and spec cache.
+    """
+    jobs_by_project = {}
+    for spec in specs:
+        project_path = Path(target_dir) / Path(spec).stem
+        jobs_by_project.setdefault(project_path, []).append(spec)
+    batches = list(jobs_by_project.values())
+
+    workers = min(len(batches), os.cpu_count() or 1)
+    if workers <= 1:
+        return _generate(specs, target_dir, use_cache)
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(
+        workers, initializer=configure_templates, initargs=(TEMPLATE_MODULE_DIR,)
+    ) as pool:
+        jobs = [pool.submit(_generate, b, target_dir, use_cache) for b in batches]
+        for job in jobs:
+            job.result()
+
+
+def validate_many(specs, use_cache=True):
+    """validates each spec and renders its templates, generating nothing
+
+    A spec that passes is one generation will accept: besides validate_spec,
+    every template of its project is rendered (in memory). Returns a list
+    of (spec, error) pairs for the specs that failed. Any error is recorded
+    against its spec, so one bad file never stops the rest of the batch
+    from being checked.
+    """
+    failures = []
+    for spec in specs:
+        try:
+            PdProject(spec, use_cache=use_cache).check()
+        except Exception as e:
+            failures.append((spec, e))
+    return failures
 
 
 # ----------------------------------------------------------------------------
-# MAIN CLASS
+# COMMANDLINE INTERFACE
+
+
+@lru_cache(maxsize=1)
+def create_argument_parser():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="xtgen",
+        description="generate skeleton puredata externals from yaml specifications",
+    )
+    parser.add_argument(
+        "spec",
+        nargs="*",
+        default=["counter.yml"],
+        help="yaml specification files (default: counter.yml)",
+    )
+    parser.add_argument(
+        "-t",
+        "--target-dir",
+        default="output",
+        help="directory in which projects are created (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="only check that the specs validate and render, generating nothing",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="neither read nor write any cache (specs, projects, templates)",
+    )
+    parser.add_argument(
+        "--no-template-cache",
+        action="store_true",
+        help="do not persist compiled templates to disk",
+    )
+    parser.add_argument(
+        "--template-cache-dir",
+        default=TEMPLATE_CACHE_DIR,
+        help="directory for compiled templates (default: %(default)s)",
+    )
+    return parser
+
+
+def main(argv=None):
+    args = create_argument_parser().parse_args(argv)
+    if args.no_cache or args.no_template_cache:
+        configure_templates(None)
+    else:
+        configure_templates(args.template_cache_dir)
+
+    if args.validate:
+        failures = validate_many(args.spec, use_cache=not args.no_cache)
+        sys.stderr.write("".join(f"{s}: {e}\n" for s, e in failures))
+        return 1 if failures else 0
+
+    generate_many(args.spec, args.target_dir, use_cache=not args.no_cache)
+
 
 if __name__ == "__main__":
-    p = PdProject("counter.yml")
-    p.generate()
+    sys.exit(main())